@@ -13,102 +13,156 @@ Environment:
 """
 from __future__ import annotations
 
+import atexit
+import codecs
+import json
 import os
+import re
 import sys
 from uuid import uuid4
 from typing import List, Tuple
 import threading
-import time
 import itertools
 import shutil
+import socket
 
 import httpx
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 SERVER = os.getenv("SERVER", "http://localhost:8000/chat")
 THREAD_ID = os.getenv("THREAD_ID", str(uuid4()))
 
+# One client for the whole session so the connection (and TLS handshake) is
+# reused across REPL turns instead of being rebuilt per prompt. Small token
+# frames go out without Nagle delay and the receive buffer is widened so a
+# burst of output is picked up in fewer recv() calls.
+_SOCKET_OPTIONS = [
+    (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+    (socket.SOL_SOCKET, socket.SO_RCVBUF, 256 * 1024),
+]
+_CLIENT = httpx.Client(
+    transport=httpx.HTTPTransport(
+        http2=True,
+        retries=0,
+        limits=httpx.Limits(max_keepalive_connections=4, keepalive_expiry=60),
+        socket_options=_SOCKET_OPTIONS,
+    ),
+    timeout=None,
+)
+atexit.register(_CLIENT.close)
+
+
+class _SpinnerService:
+    """Single long-lived thread that animates the spinner while a reply streams.
+
+    start()/stop() only toggle state, so a REPL turn no longer spawns and joins
+    its own thread. Output written through write() keeps the spinner at the
+    end of the line.
+    """
 
-def stream_once(prompt: str) -> None:
-    stop_spin = threading.Event()
-    io_lock = threading.Lock()
-
-    frames = ["⠋", "⠙", "⠹", "⠸", "⠼", "⠴", "⠦", "⠧", "⠇", "⠏"]
-    alt = ["|", "/", "-", "\\"]
-    use = frames
-    try:
-        "⠋".encode("utf-8")
-    except Exception:
-        use = alt
+    FRAMES = ["⠋", "⠙", "⠹", "⠸", "⠼", "⠴", "⠦", "⠧", "⠇", "⠏"]
     BLUE = "\x1b[94m"
     RESET = "\x1b[0m"
 
-    cur_idx = [0]
-    cur_ch = [use[0]]
+    def __init__(self) -> None:
+        self._active = threading.Event()
+        self._stopped = threading.Event()
+        self._io_lock = threading.Lock()
+        self._idx = 0
+        self._thread: threading.Thread | None = None
 
-    def write(s: str) -> None:
-        sys.stdout.write(s)
+    def _draw(self, prefix: str = "") -> None:
+        sys.stdout.write(f"{prefix}{self.BLUE}{self.FRAMES[self._idx]}{self.RESET}")
         sys.stdout.flush()
 
-    def draw_spinner_initial() -> None:
-        with io_lock:
-            write(f"{BLUE}{cur_ch[0]}{RESET}")
+    def _run(self) -> None:
+        # Continuously update the spinner character in place while active
+        while True:
+            self._active.wait()
+            if self._stopped.wait(timeout=0.1):
+                # Stopped mid-frame; go back to idle right away
+                continue
+            with self._io_lock:
+                if not self._active.is_set():
+                    continue
+                self._idx = (self._idx + 1) % len(self.FRAMES)
+                self._draw("\b")
+
+    def start(self) -> None:
+        # Print initial char so updates can replace it in place
+        with self._io_lock:
+            self._idx = 0
+            self._draw()
+            self._stopped.clear()
+            self._active.set()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def write(self, chunk: str) -> None:
+        with self._io_lock:
+            # Remove spinner at end of line, print chunk, redraw spinner
+            sys.stdout.write("\b \b")
+            sys.stdout.write(chunk)
+            sys.stdout.flush()
+            self._draw()
+
+    def stop(self) -> None:
+        with self._io_lock:
+            self._active.clear()
+            self._stopped.set()
+            sys.stdout.write("\b \b")
+            sys.stdout.flush()
 
-    def draw_spinner_update() -> None:
-        with io_lock:
-            write("\b" + f"{BLUE}{cur_ch[0]}{RESET}")
 
-    def erase_spinner() -> None:
-        with io_lock:
-            write("\b \b")
+_SPINNER = _SpinnerService()
 
-    def spinner() -> None:
-        # Continuously update the spinner character in place
-        while not stop_spin.is_set():
-            time.sleep(0.1)
-            cur_idx[0] = (cur_idx[0] + 1) % len(use)
-            cur_ch[0] = use[cur_idx[0]]
-            draw_spinner_update()
 
-    # Start spinner (print initial char so update can replace in place)
-    draw_spinner_initial()
-    t = threading.Thread(target=spinner, daemon=True)
-    t.start()
+def _encode_body(prompt: str) -> bytes:
+    # Serialise straight to bytes; prompts can carry whole attached files
+    payload = {"message": prompt, "thread_id": THREAD_ID}
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload).encode("utf-8")
 
+
+def stream_once(prompt: str) -> None:
+    _SPINNER.start()
     try:
-        with httpx.stream(
+        with _CLIENT.stream(
             "POST",
             SERVER,
-            json={"message": prompt, "thread_id": THREAD_ID},
-            timeout=None,
+            content=_encode_body(prompt),
+            # Raw bytes are passed straight through, so ask for no encoding
+            headers={"Content-Type": "application/json", "Accept-Encoding": "identity"},
         ) as r:
             r.raise_for_status()
-            for chunk in r.iter_text():
-                if not chunk:
-                    continue
-                with io_lock:
-                    # Remove spinner at end of line, print chunk, redraw spinner
-                    write("\b \b")
-                    write(chunk)
-                    write(f"{BLUE}{cur_ch[0]}{RESET}")
-        # Stop spinner and clean up
+            # Raw reads can split a UTF-8 character; hold the partial bytes
+            # back so the spinner is never drawn in the middle of one
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            for chunk in r.iter_raw():
+                text = decoder.decode(chunk)
+                if text:
+                    _SPINNER.write(text)
+            text = decoder.decode(b"", final=True)
+            if text:
+                _SPINNER.write(text)
     finally:
-        stop_spin.set()
-        t.join(timeout=0.5)
         # Ensure spinner is removed and end with newline separating from next UI
-        erase_spinner()
-        write("\n")
+        _SPINNER.stop()
+        sys.stdout.write("\n")
+        sys.stdout.flush()
+
+
+_BACKTICK_RUN = re.compile(r"`+")
 
 
 def _max_backtick_run(s: str) -> int:
-    max_run = run = 0
-    for ch in s:
-        if ch == "`":
-            run += 1
-            if run > max_run:
-                max_run = run
-        else:
-            run = 0
-    return max_run
+    return max(map(len, _BACKTICK_RUN.findall(s)), default=0)
 
 
 def _choose_fence(content: str) -> str:
@@ -117,37 +171,38 @@ def _choose_fence(content: str) -> str:
     return "`" * length
 
 
+_EXT_LANG = {
+    ".py": "python",
+    ".js": "javascript",
+    ".ts": "typescript",
+    ".sh": "bash",
+    ".bash": "bash",
+    ".json": "json",
+    ".yaml": "yaml",
+    ".yml": "yaml",
+    ".md": "markdown",
+    ".txt": "text",
+    ".go": "go",
+    ".rs": "rust",
+    ".java": "java",
+    ".c": "c",
+    ".cpp": "cpp",
+    ".toml": "toml",
+    ".ini": "ini",
+}
+
+
 def _language_from_filename(path: str) -> str:
-    name = os.path.basename(path)
-    lower = name.lower()
-    if lower == "dockerfile":
+    ext = os.path.splitext(path)[1].lower()
+    if ext == "" and os.path.basename(path).lower() == "dockerfile":
         return "dockerfile"
-    ext = os.path.splitext(lower)[1]
-    return {
-        ".py": "python",
-        ".js": "javascript",
-        ".ts": "typescript",
-        ".sh": "bash",
-        ".bash": "bash",
-        ".json": "json",
-        ".yaml": "yaml",
-        ".yml": "yaml",
-        ".md": "markdown",
-        ".txt": "text",
-        ".go": "go",
-        ".rs": "rust",
-        ".java": "java",
-        ".c": "c",
-        ".cpp": "cpp",
-        ".toml": "toml",
-        ".ini": "ini",
-    }.get(ext, "")
-
-
-def _read_text_file(path: str) -> Tuple[str, int]:
-    with open(path, "r", encoding="utf-8", errors="replace") as fh:
-        data = fh.read()
-    return data, len(data.encode("utf-8"))
+    return _EXT_LANG.get(ext, "")
+
+
+def _read_text_file(path: str) -> str:
+    with open(path, "rb") as fh:
+        raw = fh.read()
+    return raw.decode("utf-8", "replace")
 
 
 def _strip_quotes(s: str) -> str:
@@ -163,30 +218,31 @@ def _resolve_path(p: str) -> str:
     return os.path.abspath(p)
 
 
+# A whole "/file PATH" or "/file:PATH" line, including its line break. The
+# path must contain a non-blank character, so a bare "/file   " stays text
+_FILE_RE = re.compile(r"^[ \t]*/file(?::|[ \t]+)[ \t]*(\S.*)$\n?", re.MULTILINE)
+
+
 def _parse_file_commands(text: str) -> Tuple[str, List[Tuple[str, str]]]:
     """Extract /file PATH lines and return (clean_text, attachments)."""
     attachments: List[Tuple[str, str]] = []
-    kept_lines: List[str] = []
-    for raw_line in text.splitlines():
-        line = raw_line.strip()
-        if line.startswith("/file"):
-            path = None
-            if line.startswith("/file:"):
-                path = _resolve_path(line.split(":", 1)[1])
-            else:
-                parts = raw_line.split(None, 1)
-                if len(parts) == 2:
-                    path = _resolve_path(parts[1])
-            if path:
-                try:
-                    content, _ = _read_text_file(path)
-                    attachments.append((path, content))
-                except OSError as e:
-                    kept_lines.append(raw_line)
-                    kept_lines.append(f"[client] Failed to read {path}: {e}")
-                continue
-        kept_lines.append(raw_line)
-    clean_text = "\n".join(kept_lines)
+    kept: List[str] = []
+    pos = 0
+    for m in _FILE_RE.finditer(text):
+        path = _resolve_path(m.group(1))
+        try:
+            content = _read_text_file(path)
+        except OSError as e:
+            # Keep the command line and report the failure right below it
+            kept.append(text[pos:m.end(1)])
+            kept.append(f"\n[client] Failed to read {path}: {e}")
+            pos = m.end(1)
+            continue
+        attachments.append((path, content))
+        kept.append(text[pos:m.start()])
+        pos = m.end()
+    kept.append(text[pos:])
+    clean_text = "".join(kept)
     return clean_text, attachments
 
 
@@ -27,6 +27,11 @@ import termios
 import tty
 from typing import List, Tuple
 
+try:
+    import orjson
+except ImportError:  # stdlib json keeps the client dependency-free
+    orjson = None
+
 
 TYPE_DATA = 0x00
 TYPE_RESZ = 0x01
@@ -34,6 +39,8 @@ TYPE_EXIT = 0x02
 TYPE_HELO = 0x10
 TYPE_ERR  = 0xFF
 
+_FRAME_EXIT = bytes([TYPE_EXIT, 0, 0, 0, 0])
+
 
 def pack_frame(ftype: int, payload: bytes = b"") -> bytes:
     return bytes([ftype]) + struct.pack(">I", len(payload)) + payload
@@ -41,12 +48,9 @@ def pack_frame(ftype: int, payload: bytes = b"") -> bytes:
 
 async def read_frame(reader: asyncio.StreamReader) -> tuple[int, bytes]:
     header = await reader.readexactly(5)
-    ftype = header[0]
-    (length,) = struct.unpack(">I", header[1:5])
-    payload = b""
-    if length:
-        payload = await reader.readexactly(length)
-    return ftype, payload
+    length = int.from_bytes(header[1:5], "big")
+    payload = await reader.readexactly(length) if length else b""
+    return header[0], payload
 
 
 def get_winsize(fd: int) -> Tuple[int, int]:
@@ -75,19 +79,31 @@ async def run_client(host: str, port: int, token: str | None, cmd: List[str] | N
     if cmd:
         hello["cmd"] = cmd
 
-    writer.write(pack_frame(TYPE_HELO, json.dumps(hello).encode("utf-8")))
+    body = orjson.dumps(hello) if orjson is not None else json.dumps(hello).encode("utf-8")
+    writer.write(pack_frame(TYPE_HELO, body))
     await writer.drain()
 
     # Handle window changes
     loop = asyncio.get_running_loop()
 
-    def on_winch() -> None:
+    pending_winch: asyncio.TimerHandle | None = None
+
+    def send_winch() -> None:
+        nonlocal pending_winch
+        pending_winch = None
         r, c = get_winsize(stdin_fd)
         try:
             writer.write(bytes([TYPE_RESZ]) + struct.pack(">I", 8) + struct.pack(">II", int(r), int(c)))
         except Exception:
             pass
 
+    def on_winch() -> None:
+        # Window drags fire SIGWINCH in bursts; only send the final size
+        nonlocal pending_winch
+        if pending_winch is not None:
+            pending_winch.cancel()
+        pending_winch = loop.call_later(0.05, send_winch)
+
     try:
         loop.add_signal_handler(signal.SIGWINCH, on_winch)
     except (NotImplementedError, RuntimeError):
@@ -96,15 +112,27 @@ async def run_client(host: str, port: int, token: str | None, cmd: List[str] | N
     # Queue for stdin bytes
     input_q: asyncio.Queue[bytes] = asyncio.Queue()
 
+    # Read from a separate, non-blocking description of the terminal so one
+    # readiness event can drain it; O_NONBLOCK on fd 0 would leak onto stdout
+    tty_in = os.open(os.ttyname(stdin_fd), os.O_RDONLY | os.O_NONBLOCK | os.O_CLOEXEC)
+
     def on_stdin_readable() -> None:
-        try:
-            data = os.read(stdin_fd, 4096)
-            if data:
-                input_q.put_nowait(data)
-        except OSError:
-            pass
+        # Drain everything the kernel has and queue it as one chunk, so a
+        # single wakeup becomes a single data frame
+        chunks = []
+        while True:
+            try:
+                data = os.read(tty_in, 65536)
+            except OSError:
+                # BlockingIOError once drained
+                break
+            if not data:
+                break
+            chunks.append(data)
+        if chunks:
+            input_q.put_nowait(chunks[0] if len(chunks) == 1 else b"".join(chunks))
 
-    loop.add_reader(stdin_fd, on_stdin_readable)
+    loop.add_reader(tty_in, on_stdin_readable)
 
     async def pump_stdin() -> None:
         while True:
@@ -146,9 +174,11 @@ async def run_client(host: str, port: int, token: str | None, cmd: List[str] | N
         for t in pending:
             t.cancel()
     finally:
+        loop.remove_reader(tty_in)
+        os.close(tty_in)
         termios.tcsetattr(stdin_fd, termios.TCSADRAIN, orig_attrs)
         try:
-            writer.write(pack_frame(TYPE_EXIT))
+            writer.write(_FRAME_EXIT)
             await writer.drain()
         except Exception:
             pass
@@ -34,6 +34,11 @@ import sys
 import atexit
 from typing import Optional
 
+try:
+    import orjson
+except ImportError:  # stdlib json keeps the daemon dependency-free
+    orjson = None
+
 
 TYPE_DATA = 0x00
 TYPE_RESZ = 0x01
@@ -41,19 +46,34 @@ TYPE_EXIT = 0x02
 TYPE_HELO = 0x10
 TYPE_ERR  = 0xFF
 
+_HDR_DATA = bytes([TYPE_DATA])
+_FRAME_EXIT = bytes([TYPE_EXIT, 0, 0, 0, 0])
+
+# Stop reading the PTY once this much output is queued for the socket
+_WRITE_HIGH = 256 * 1024
+
+# PTY output is coalesced into frames of up to _FRAME_MAX bytes, flushed
+# when full or _COALESCE_DELAY seconds after the first byte arrived
+_FRAME_MAX = 65536
+_COALESCE_DELAY = 0.002
+
 
 def _pack_frame(ftype: int, payload: bytes = b"") -> bytes:
     return bytes([ftype]) + struct.pack(">I", len(payload)) + payload
 
 
+# Fixed error frames, built once
+_FRAME_TIMEOUT = _pack_frame(TYPE_ERR, b"handshake timeout")
+_FRAME_EXPECT_HELO = _pack_frame(TYPE_ERR, b"expected handshake frame")
+_FRAME_BAD_JSON = _pack_frame(TYPE_ERR, b"invalid handshake json")
+_FRAME_UNAUTHORIZED = _pack_frame(TYPE_ERR, b"unauthorized")
+
+
 async def _read_frame(reader: asyncio.StreamReader) -> tuple[int, bytes]:
     header = await reader.readexactly(5)
-    ftype = header[0]
-    (length,) = struct.unpack(">I", header[1:5])
-    payload = b""
-    if length:
-        payload = await reader.readexactly(length)
-    return ftype, payload
+    length = int.from_bytes(header[1:5], "big")
+    payload = await reader.readexactly(length) if length else b""
+    return header[0], payload
 
 
 def _set_winsize(fd: int, rows: int, cols: int) -> None:
@@ -72,28 +92,31 @@ async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWrit
         ftype, payload = await asyncio.wait_for(_read_frame(reader), timeout=5)
     except Exception:
         try:
-            writer.write(_pack_frame(TYPE_ERR, b"handshake timeout"))
+            writer.write(_FRAME_TIMEOUT)
             await writer.drain()
         finally:
             writer.close()
             await writer.wait_closed()
         return
     if ftype != TYPE_HELO:
-        writer.write(_pack_frame(TYPE_ERR, b"expected handshake frame"))
+        writer.write(_FRAME_EXPECT_HELO)
         await writer.drain()
         writer.close()
         return
     try:
-        hello = json.loads(payload.decode("utf-8", errors="replace"))
+        if orjson is not None:
+            hello = orjson.loads(payload)
+        else:
+            hello = json.loads(payload.decode("utf-8", errors="replace"))
     except Exception:
-        writer.write(_pack_frame(TYPE_ERR, b"invalid handshake json"))
+        writer.write(_FRAME_BAD_JSON)
         await writer.drain()
         writer.close()
         return
 
     token = hello.get("token")
     if expected and token != expected:
-        writer.write(_pack_frame(TYPE_ERR, b"unauthorized"))
+        writer.write(_FRAME_UNAUTHORIZED)
         await writer.drain()
         writer.close()
         return
@@ -127,21 +150,63 @@ async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWrit
         pass
 
     stop = asyncio.Event()
+    writer.transport.set_write_buffer_limits(high=_WRITE_HIGH)
+    drain_task: Optional[asyncio.Future] = None
+    flush_handle: Optional[asyncio.TimerHandle] = None
+
+    # Read into one reusable buffer and coalesce into `pending`
+    read_view = memoryview(bytearray(_FRAME_MAX))
+    pending = bytearray()
+
+    async def resume_after_drain() -> None:
+        try:
+            await writer.drain()
+        except Exception:
+            stop.set()
+            return
+        if not stop.is_set():
+            loop.add_reader(master_fd, on_pty_readable)
+
+    def flush() -> None:
+        nonlocal drain_task, flush_handle, pending
+        if flush_handle is not None:
+            flush_handle.cancel()
+            flush_handle = None
+        try:
+            if not pending:
+                return
+            writer.writelines((_HDR_DATA + struct.pack(">I", len(pending)), pending))
+            pending = bytearray()
+        except OSError:
+            stop.set()
+            return
+        if writer.transport.get_write_buffer_size() > _WRITE_HIGH and not stop.is_set():
+            # Socket is behind; pause the PTY until the buffer drains
+            loop.remove_reader(master_fd)
+            drain_task = asyncio.ensure_future(resume_after_drain())
 
     def on_pty_readable() -> None:
+        nonlocal flush_handle
         try:
-            data = os.read(master_fd, 4096)
-            if data:
-                writer.write(_pack_frame(TYPE_DATA, data))
-            else:
+            n = os.readv(master_fd, [read_view[:_FRAME_MAX - len(pending)]])
+            pending.extend(read_view[:n])
+            if not n:
+                flush()
                 loop.remove_reader(master_fd)
                 if not stop.is_set():
                     stop.set()
+            elif len(pending) >= _FRAME_MAX:
+                flush()
+            elif flush_handle is None:
+                flush_handle = loop.call_later(_COALESCE_DELAY, flush)
+        except BlockingIOError:
+            pass
         except OSError:
             try:
                 loop.remove_reader(master_fd)
             except Exception:
                 pass
+            flush()
             if not stop.is_set():
                 stop.set()
 
@@ -176,10 +241,13 @@ async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWrit
     client_task = asyncio.create_task(pump_client())
 
     try:
-        while not stop.is_set():
-            await asyncio.wait({client_task}, timeout=0.05)
-            await writer.drain()
+        await stop.wait()
     finally:
+        client_task.cancel()
+        if drain_task is not None:
+            drain_task.cancel()
+        # Send whatever output was still being coalesced
+        flush()
         try:
             loop.remove_reader(master_fd)
         except Exception:
@@ -193,7 +261,7 @@ async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWrit
         except Exception:
             pass
         try:
-            writer.write(_pack_frame(TYPE_EXIT, b""))
+            writer.write(_FRAME_EXIT)
             await writer.drain()
         except Exception:
             pass
@@ -266,7 +334,15 @@ if __name__ == "__main__":
     try:
         if args.daemon:
             daemonize(args.pidfile)
-        asyncio.run(main())
+        try:
+            import uvloop
+        except ImportError:
+            uvloop = None
+        if uvloop is not None and hasattr(uvloop, "run"):
+            # uvloop.run() (0.18+) replaces the deprecated install() + asyncio.run()
+            uvloop.run(main())
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         # Exit code 130 indicates SIGINT-like exit
         sys.exit(130)
@@ -1,14 +1,14 @@
 import os
 import uuid
 import asyncio
-import json
+import orjson
 import pty
 import fcntl
 import termios
 import struct
 import signal
 import shutil
-from typing import AsyncIterator, Optional
+from typing import Any, AsyncIterator, Optional, get_args
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException
@@ -28,6 +28,18 @@ if not api_key:
 LLM = ChatOpenAI(model="gpt-4o", temperature=0.2, streaming=True, openai_api_key=api_key)
 GRAPH = build_reasoning_graph(LLM)
 
+
+def _supports_messages_mode() -> bool:
+    # stream_mode="messages" (per-token chunks) only exists in newer LangGraph
+    try:
+        from langgraph.types import StreamMode
+    except ImportError:
+        return False
+    return "messages" in get_args(StreamMode)
+
+
+STREAM_MODE = "messages" if _supports_messages_mode() else "values"
+
 # ---------- FastAPI -----------------------------------------------------------
 app = FastAPI(title="Web Agent Demo", version="0.1.0")
 
@@ -46,36 +58,65 @@ def health() -> str:
     return "ok"
 
 
-async def _token_stream(user_message: str) -> AsyncIterator[str]:
+def _is_ai(message: Any) -> bool:
+    role = (getattr(message, "type", None) or getattr(message, "role", ""))
+    return str(role).lower() in {"ai", "assistant", "aimessagechunk"}
+
+
+async def _message_deltas(inputs: dict, config: dict) -> AsyncIterator[str]:
+    # Each event already carries just the new tokens
+    async for chunk, _metadata in GRAPH.astream(inputs, stream_mode="messages", config=config):
+        if not _is_ai(chunk):
+            # Skip echoing user/tool/system messages
+            continue
+        content = getattr(chunk, "content", None)
+        if content and isinstance(content, str):
+            yield content
+
+
+async def _value_deltas(inputs: dict, config: dict) -> AsyncIterator[str]:
+    # Fallback for LangGraph without "messages" mode: diff the full message
     last = ""
+    async for event in GRAPH.astream(inputs, stream_mode="values", config=config):
+        if not isinstance(event, dict):
+            continue
+        messages = event.get("messages")
+        if not messages:
+            continue
+        last_msg = messages[-1]
+        if not _is_ai(last_msg):
+            # Skip echoing user/tool/system messages
+            continue
+        content = getattr(last_msg, "content", None)
+        if content:
+            text = str(content)
+            if len(text) >= len(last) and text.startswith(last):
+                delta = text[len(last):]
+            else:
+                delta = text
+            last = text
+            if delta:
+                yield delta
+
+
+_ERR_PREFIX = b"\n[ERROR] "
+_ERR_SUFFIX = b"\n"
+
+
+async def _chat_stream(user_message: str, thread_id: str) -> AsyncIterator[bytes]:
+    inputs = {"messages": [{"role": "user", "content": user_message}]}
+    config = {"configurable": {"thread_id": thread_id}}
+    deltas = _message_deltas if STREAM_MODE == "messages" else _value_deltas
     try:
-        for event in GRAPH.stream(
-            {"messages": [{"role": "user", "content": user_message}]},
-            stream_mode="values",
-            config={"configurable": {"thread_id": "default"}},
-        ):
-            if not isinstance(event, dict):
-                continue
-            messages = event.get("messages")
-            if not messages:
-                continue
-            last_msg = messages[-1]
-            role = (getattr(last_msg, "type", None) or getattr(last_msg, "role", ""))
-            if str(role).lower() not in {"ai", "assistant"}:
-                # Skip echoing user/tool/system messages
-                continue
-            content = getattr(last_msg, "content", None)
-            if content:
-                text = str(content)
-                if len(text) >= len(last) and text.startswith(last):
-                    delta = text[len(last):]
-                else:
-                    delta = text
-                last = text
-                if delta:
-                    yield delta
+        # astream runs graph steps off the event loop, so concurrent /chat
+        # requests interleave instead of queueing behind one another.
+        async for delta in deltas(inputs, config):
+            # Encode once here rather than leaving it to Starlette per chunk
+            yield delta.encode("utf-8")
+            # Let the response write go out before the next graph step
+            await asyncio.sleep(0)
     except Exception as e:
-        yield f"\n[ERROR] {e}\n"
+        yield _ERR_PREFIX + str(e).encode("utf-8") + _ERR_SUFFIX
 
 
 @app.post("/chat")
@@ -85,42 +126,16 @@ async def chat(payload: dict):
     if not msg:
         raise HTTPException(422, "message field required")
 
-    async def _stream() -> AsyncIterator[str]:
-        last = ""
-        try:
-            for event in GRAPH.stream(
-                {"messages": [{"role": "user", "content": msg}]},
-                stream_mode="values",
-                config={"configurable": {"thread_id": str(thread_id)}},
-            ):
-                if not isinstance(event, dict):
-                    continue
-                messages = event.get("messages")
-                if not messages:
-                    continue
-                last_msg = messages[-1]
-                role = (getattr(last_msg, "type", None) or getattr(last_msg, "role", ""))
-                if str(role).lower() not in {"ai", "assistant"}:
-                    # Skip echoing user/tool/system messages
-                    continue
-                content = getattr(last_msg, "content", None)
-                if content:
-                    text = str(content)
-                    if len(text) >= len(last) and text.startswith(last):
-                        delta = text[len(last):]
-                    else:
-                        delta = text
-                    last = text
-                    if delta:
-                        yield delta
-        except Exception as e:
-            yield f"\n[ERROR] {e}\n"
-
-    return StreamingResponse(_stream(), media_type="text/plain")
+    return StreamingResponse(_chat_stream(msg, str(thread_id)), media_type="text/plain")
 
 
 # -------------------- Interactive shell over WebSocket -----------------------
 
+# Fixed control messages, encoded once
+_MSG_UNAUTHORIZED = orjson.dumps({"type": "error", "message": "unauthorized"}).decode()
+_MSG_EXIT = orjson.dumps({"type": "exit"}).decode()
+
+
 def _set_winsize(fd: int, rows: int, cols: int) -> None:
     # TIOCSWINSZ expects unsigned short (rows, cols, xpix, ypix)
     try:
@@ -146,7 +161,7 @@ async def shell_ws(ws: WebSocket) -> None:
         else:
             supplied = ws.query_params.get("token")
         if not supplied or supplied != expected:
-            await ws.send_text(json.dumps({"type": "error", "message": "unauthorized"}))
+            await ws.send_text(_MSG_UNAUTHORIZED)
             await ws.close(code=4401)
             return
 
@@ -156,7 +171,7 @@ async def shell_ws(ws: WebSocket) -> None:
     try:
         init_msg = await asyncio.wait_for(ws.receive_text(), timeout=3.0)
         try:
-            payload = json.loads(init_msg)
+            payload = orjson.loads(init_msg)
             if isinstance(payload, dict) and payload.get("type") == "init":
                 rows = int(payload.get("rows", rows))
                 cols = int(payload.get("cols", cols))
@@ -167,7 +182,7 @@ async def shell_ws(ws: WebSocket) -> None:
                     # Execute string via shell -lc "..." to allow compound commands
                     sh = shutil.which("bash") or shutil.which("sh") or "/bin/sh"
                     cmd = [sh, "-lc", _cmd]
-        except json.JSONDecodeError:
+        except orjson.JSONDecodeError:
             # Not JSON; treat as regular input and proceed with defaults
             pass
     except asyncio.TimeoutError:
@@ -245,7 +260,7 @@ async def shell_ws(ws: WebSocket) -> None:
                         break
                 elif "text" in msg and msg["text"] is not None:
                     try:
-                        payload = json.loads(msg["text"]) if msg["text"].startswith("{") else None
+                        payload = orjson.loads(msg["text"]) if msg["text"].startswith("{") else None
                     except Exception:
                         payload = None
                     if isinstance(payload, dict) and payload.get("type") == "resize":
@@ -282,7 +297,7 @@ async def shell_ws(ws: WebSocket) -> None:
             pass
         try:
             # Try to send an exit notice if still connected
-            await ws.send_text(json.dumps({"type": "exit"}))
+            await ws.send_text(_MSG_EXIT)
         except Exception:
             pass
         try:
@@ -298,4 +313,4 @@ async def shell_ws(ws: WebSocket) -> None:
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run("server:app", host="0.0.0.0", port=8000)
+    uvicorn.run("server:app", host="0.0.0.0", port=8000, loop="uvloop", http="httptools")
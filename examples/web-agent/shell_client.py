@@ -7,9 +7,12 @@ Usage:
   python shell_client.py --cmd /bin/bash -l
 
 Requires:
-  pip install websockets
+  Python 3.11+ (asyncio.TaskGroup); no third-party packages
+  (numpy, if installed, speeds up masking of large pastes)
 
 Notes:
+  - Speaks a minimal WebSocket client (text/binary, ping/pong, close) on
+    asyncio streams instead of the websockets package.
   - Sends raw stdin bytes to server and renders PTY output.
   - Uses an init message with terminal size and optional command.
   - Sends resize events on SIGWINCH.
@@ -18,32 +21,314 @@ from __future__ import annotations
 
 import argparse
 import asyncio
+import base64
+import hashlib
 import json
 import os
 import signal
+import ssl
 import struct
 import sys
 import termios
 import fcntl
 import tty
-from typing import List, Tuple
+from typing import Awaitable, Dict, List, NoReturn, Tuple
+from urllib.parse import urlsplit
 
 try:
-    import websockets
-except ImportError as e:
-    print("Missing dependency: websockets. Install with `pip install websockets`.")
-    raise
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Upper bound for one coalesced stdin message
+_MAX_SEND = 64 * 1024
+# Flush batched PTY output to the terminal once it reaches this size; frames
+# at least this large skip the batch and are written as received
+_MAX_WRITE = 64 * 1024
+
+# Preallocated staging area for batched PTY output; small frames are copied
+# in place so the hot path never grows or reallocates a buffer. The batch is
+# under _MAX_WRITE before each copy and so is the frame, so twice that fits
+_OUT_BUF = bytearray(2 * _MAX_WRITE)
+_OUT_MV = memoryview(_OUT_BUF)
+
+# Must go out as a text frame: binary frames are fed to the PTY as input
+_RESIZE_FMT = '{"type": "resize", "rows": %d, "cols": %d}'
+
+
+# Reused for every TIOCGWINSZ call; the ioctl fills it in place
+_WINSZ_BUF = bytearray(8)
+_WINSZ_UNPACK = struct.Struct("HHHH").unpack_from
 
 
 def get_winsize(fd: int) -> Tuple[int, int]:
     try:
-        packed = fcntl.ioctl(fd, termios.TIOCGWINSZ, b"\x00" * 8)
-        rows, cols, _, _ = struct.unpack("HHHH", packed)
+        fcntl.ioctl(fd, termios.TIOCGWINSZ, _WINSZ_BUF, True)
+        rows, cols, _, _ = _WINSZ_UNPACK(_WINSZ_BUF)
         return (rows or 24), (cols or 80)
     except Exception:
         return 24, 80
 
 
+class _SessionEnded(Exception):
+    """A pump finished; used to tear down the TaskGroup."""
+
+
+def _write_all(fd: int, data: bytes | bytearray | memoryview) -> None:
+    view = memoryview(data)
+    while view:
+        n = os.write(fd, view)
+        view = view[n:]
+
+
+# ---------- Minimal WebSocket client (RFC 6455) -------------------------------
+
+_WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+# Give up on the TCP connect + upgrade after this long (the terminal is
+# already raw, so Ctrl-C can't break a hang)
+_OPEN_TIMEOUT = 10
+# Ping an idle link this often and drop it if no pong comes back in time
+_PING_INTERVAL = 20
+_PING_TIMEOUT = 20
+_OP_CONT = 0x0
+_OP_TEXT = 0x1
+_OP_BINARY = 0x2
+_OP_CLOSE = 0x8
+_OP_PING = 0x9
+_OP_PONG = 0xA
+_DATA_OPS = frozenset((_OP_CONT, _OP_TEXT, _OP_BINARY))
+_CONTROL_OPS = frozenset((_OP_CLOSE, _OP_PING, _OP_PONG))
+# Close codes, pre-packed as the close frame payload
+_CLOSE_NORMAL = b"\x03\xe8"  # 1000
+_CLOSE_PROTOCOL = b"\x03\xea"  # 1002
+_CLOSE_BAD_DATA = b"\x03\xef"  # 1007
+
+
+# Below this size numpy's call overhead outweighs its vectorized XOR
+_NP_MASK_MIN = 512
+
+
+class _ConnectionClosed(Exception):
+    """The WebSocket was closed by either side or the stream hit EOF."""
+
+
+def _mask(payload: bytes, key: bytes) -> bytes:
+    n = len(payload)
+    if not n:
+        return b""
+    if np is not None and n >= _NP_MASK_MIN:
+        # frombuffer views both operands in place; tobytes() is the one copy
+        keys = np.frombuffer(key * ((n + 3) // 4), dtype=np.uint8)[:n]
+        return (np.frombuffer(payload, dtype=np.uint8) ^ keys).tobytes()
+    # XOR the whole payload as one big integer: a single C-level pass
+    stream = (key * (n // 4 + 1))[:n]
+    return (int.from_bytes(payload, "big") ^ int.from_bytes(stream, "big")).to_bytes(n, "big")
+
+
+def _frame(opcode: int, payload: bytes) -> bytes:
+    # Client frames are always final and masked
+    n = len(payload)
+    if n < 126:
+        header = struct.pack("!BB", 0x80 | opcode, 0x80 | n)
+    elif n < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 0x80 | 126, n)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 0x80 | 127, n)
+    key = os.urandom(4)
+    return header + key + _mask(payload, key)
+
+
+class _WebSocket:
+    """Just enough of a WebSocket client for the PTY bridge.
+
+    No extensions (so no compression) and no subprotocols. Frames are parsed
+    straight off the StreamReader and pings are answered inline.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._reader = reader
+        self._writer = writer
+        self._close_sent = False
+        self._ping_data = b""
+        self._pong_waiter: asyncio.Future | None = None
+        self._keepalive_task: asyncio.Task | None = None
+
+    @classmethod
+    async def connect(
+        cls,
+        url: str,
+        headers: Dict[str, str],
+        write_limit: int = 2**20,
+        open_timeout: float = _OPEN_TIMEOUT,
+        ping_interval: float = _PING_INTERVAL,
+        ping_timeout: float = _PING_TIMEOUT,
+    ) -> "_WebSocket":
+        try:
+            async with asyncio.timeout(open_timeout):
+                ws = await cls._open(url, headers, write_limit)
+        except TimeoutError as e:
+            raise _ConnectionClosed(f"timed out connecting to {url}") from e
+        ws._keepalive_task = asyncio.ensure_future(ws._keepalive(ping_interval, ping_timeout))
+        return ws
+
+    @classmethod
+    async def _open(cls, url: str, headers: Dict[str, str], write_limit: int) -> "_WebSocket":
+        u = urlsplit(url)
+        if u.scheme not in {"ws", "wss"}:
+            raise ValueError(f"unsupported URL scheme: {u.scheme!r}")
+        secure = u.scheme == "wss"
+        reader, writer = await asyncio.open_connection(
+            u.hostname,
+            u.port or (443 if secure else 80),
+            ssl=ssl.create_default_context() if secure else None,
+        )
+        try:
+            writer.transport.set_write_buffer_limits(high=write_limit)
+
+            key = base64.b64encode(os.urandom(16)).decode("ascii")
+            target = (u.path or "/") + (f"?{u.query}" if u.query else "")
+            lines = [
+                f"GET {target} HTTP/1.1",
+                f"Host: {u.netloc.rpartition('@')[2]}",
+                "Upgrade: websocket",
+                "Connection: Upgrade",
+                f"Sec-WebSocket-Key: {key}",
+                "Sec-WebSocket-Version: 13",
+            ]
+            lines += [f"{k}: {v}" for k, v in headers.items()]
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+                raise _ConnectionClosed("handshake failed: no HTTP response") from e
+            status, *header_lines = head.decode("latin-1").split("\r\n")
+            resp = {}
+            for line in header_lines:
+                name, sep, value = line.partition(":")
+                if sep:
+                    resp[name.strip().lower()] = value.strip()
+            accept = base64.b64encode(hashlib.sha1(key.encode("ascii") + _WS_GUID).digest()).decode("ascii")
+            if status.split(" ", 2)[1:2] != ["101"] or resp.get("sec-websocket-accept") != accept:
+                raise _ConnectionClosed(f"handshake failed: {status}")
+            return cls(reader, writer)
+        except BaseException:
+            writer.close()
+            raise
+
+    async def _keepalive(self, interval: float, timeout: float) -> None:
+        # recv() resolves the waiter when the matching pong is read, so this
+        # only works while something is reading; pump_ws always is
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            self._ping_data = os.urandom(4)
+            self._pong_waiter = loop.create_future()
+            self._writer.write(_frame(_OP_PING, self._ping_data))
+            try:
+                async with asyncio.timeout(timeout):
+                    await self._pong_waiter
+            except TimeoutError:
+                # Half-open link: abort so the pending read fails right away
+                self._writer.transport.abort()
+                return
+
+    async def send(self, data: bytes | str) -> None:
+        if isinstance(data, str):
+            self._writer.write(_frame(_OP_TEXT, data.encode("utf-8")))
+        else:
+            self._writer.write(_frame(_OP_BINARY, data))
+        await self._writer.drain()
+
+    async def recv(self) -> bytes | str:
+        """Return the next data message: bytes for binary, str for text."""
+        read = self._reader.readexactly
+        fragments: List[bytes] = []
+        msg_op = _OP_BINARY
+        try:
+            while True:
+                b0, b1 = await read(2)
+                opcode = b0 & 0x0F
+                n = b1 & 0x7F
+                # No extensions were negotiated, so RSV bits must be clear;
+                # servers never mask, and control frames are short and final
+                if b0 & 0x70 or b1 & 0x80:
+                    await self._fail(_CLOSE_PROTOCOL, "invalid frame header")
+                if opcode in _CONTROL_OPS:
+                    if n > 125 or not b0 & 0x80:
+                        await self._fail(_CLOSE_PROTOCOL, "invalid control frame")
+                elif opcode not in _DATA_OPS:
+                    await self._fail(_CLOSE_PROTOCOL, f"reserved opcode {opcode:#x}")
+                elif (opcode == _OP_CONT) != bool(fragments):
+                    await self._fail(_CLOSE_PROTOCOL, "unexpected continuation state")
+                if n == 126:
+                    n = int.from_bytes(await read(2), "big")
+                elif n == 127:
+                    n = int.from_bytes(await read(8), "big")
+                payload = await read(n) if n else b""
+
+                if opcode == _OP_PING:
+                    self._writer.write(_frame(_OP_PONG, payload))
+                    continue
+                if opcode == _OP_PONG:
+                    waiter = self._pong_waiter
+                    if waiter is not None and not waiter.done() and payload == self._ping_data:
+                        waiter.set_result(None)
+                    continue
+                if opcode == _OP_CLOSE:
+                    await self.close(payload[:2])
+                    raise _ConnectionClosed("closed by peer")
+                if opcode != _OP_CONT:
+                    msg_op = opcode
+                fragments.append(payload)
+                if b0 & 0x80:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            raise _ConnectionClosed("connection lost") from e
+        data = fragments[0] if len(fragments) == 1 else b"".join(fragments)
+        if msg_op != _OP_TEXT:
+            return data
+        try:
+            return data.decode("utf-8")
+        except UnicodeDecodeError:
+            await self._fail(_CLOSE_BAD_DATA, "invalid UTF-8 in text frame")
+
+    async def _fail(self, code: bytes, reason: str) -> NoReturn:
+        # Fail the connection as RFC 6455 requires: close with code, then stop
+        await self.close(code)
+        raise _ConnectionClosed(reason)
+
+    def __aiter__(self) -> "_WebSocket":
+        return self
+
+    async def __anext__(self) -> bytes | str:
+        try:
+            return await self.recv()
+        except _ConnectionClosed:
+            raise StopAsyncIteration
+
+    async def close(self, code: bytes = _CLOSE_NORMAL) -> None:
+        if self._close_sent:
+            return
+        self._close_sent = True
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+        try:
+            self._writer.write(_frame(_OP_CLOSE, code))
+            await self._writer.drain()
+            self._writer.close()
+            await self._writer.wait_closed()
+        except Exception:
+            pass
+
+    async def __aenter__(self) -> "_WebSocket":
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.close()
+
+
 async def run_client(url: str, token: str | None, cmd: List[str] | None) -> int:
     # Build connection headers
     headers = {}
@@ -51,89 +336,154 @@ async def run_client(url: str, token: str | None, cmd: List[str] | None) -> int:
         headers["Authorization"] = f"Bearer {token}"
 
     stdin_fd = sys.stdin.fileno()
-    stdout = sys.stdout.buffer
+    # PTY output goes straight to the fd, skipping BufferedWriter's copy+lock
+    stdout_fd = sys.stdout.fileno()
 
     # Save and set raw mode on TTY
     orig_attrs = termios.tcgetattr(stdin_fd)
     tty.setraw(stdin_fd)
 
-    rows, cols = get_winsize(stdin_fd)
+    try:
+        rows, cols = get_winsize(stdin_fd)
 
-    # Use a queue so add_reader can enqueue stdin bytes without awaiting
-    input_q: asyncio.Queue[bytes] = asyncio.Queue()
+        # No permessage-deflate is offered: keystrokes are tiny and PTY output
+        # rarely compresses well enough to pay for it. A wide write buffer
+        # absorbs paste bursts; frames are only read off the socket as fast as
+        # the terminal takes them, which pushes back on the server.
+        async with await _WebSocket.connect(url, headers, write_limit=2**20) as ws:
+            # Send init message
+            init_msg = {"type": "init", "rows": rows, "cols": cols}
+            if cmd:
+                init_msg["cmd"] = cmd
+            init_payload = json.dumps(init_msg)
+            await ws.send(init_payload)
 
-    async with websockets.connect(url, extra_headers=headers, max_size=None) as ws:
-        # Send init message
-        init_msg = {"type": "init", "rows": rows, "cols": cols}
-        if cmd:
-            init_msg["cmd"] = cmd
-        await ws.send(json.dumps(init_msg))
+            loop = asyncio.get_running_loop()
 
-        loop = asyncio.get_running_loop()
+            # Resize handler: SIGWINCH arrives in bursts while a window is
+            # dragged, so send one resize 50 ms after the first signal
+            resize_handle: asyncio.TimerHandle | None = None
+            resize_send: asyncio.Future | None = None
 
-        # Resize handler
-        def on_winch() -> None:
-            r, c = get_winsize(stdin_fd)
-            try:
-                loop.create_task(ws.send(json.dumps({"type": "resize", "rows": r, "cols": c})))
-            except RuntimeError:
-                pass
+            def flush_resize() -> None:
+                nonlocal resize_handle, resize_send
+                if resize_send is not None and not resize_send.done():
+                    # Previous resize is still stuck behind a full send buffer;
+                    # don't queue another, just look again shortly
+                    resize_handle = loop.call_later(0.05, flush_resize)
+                    return
+                resize_handle = None
+                r, c = get_winsize(stdin_fd)
+                try:
+                    resize_send = asyncio.ensure_future(ws.send(_RESIZE_FMT % (r, c)))
+                except RuntimeError:
+                    pass
 
-        try:
-            loop.add_signal_handler(signal.SIGWINCH, on_winch)
-        except (NotImplementedError, RuntimeError):
-            # Signal handlers may not be available (e.g., on some platforms)
-            pass
+            def on_winch() -> None:
+                nonlocal resize_handle
+                if resize_handle is None:
+                    resize_handle = loop.call_later(0.05, flush_resize)
 
-        # STDIN readiness -> enqueue bytes
-        def on_stdin_readable() -> None:
             try:
-                data = os.read(stdin_fd, 4096)
-                if data:
-                    input_q.put_nowait(data)
-            except OSError:
+                loop.add_signal_handler(signal.SIGWINCH, on_winch)
+            except (NotImplementedError, RuntimeError):
+                # Signal handlers may not be available (e.g., on some platforms)
                 pass
 
-        loop.add_reader(stdin_fd, on_stdin_readable)
+            # STDIN -> StreamReader via a read-pipe transport. The transport gets
+            # its own open file description of the terminal because it switches
+            # the fd to non-blocking, which must not leak onto the shared stdout.
+            # The transport pauses reading once 2 * limit bytes are unsent, so a
+            # slow link bounds memory instead of buffering input without limit
+            stdin_reader = asyncio.StreamReader(limit=_MAX_SEND)
+            stdin_transport, _ = await loop.connect_read_pipe(
+                lambda: asyncio.StreamReaderProtocol(stdin_reader),
+                open(os.ttyname(stdin_fd), "rb", buffering=0),
+            )
 
-        async def pump_stdin() -> None:
-            while True:
-                data = await input_q.get()
-                try:
-                    await ws.send(data)
-                except Exception:
-                    break
-
-        async def pump_ws() -> None:
-            while True:
-                try:
-                    msg = await ws.recv()
-                except websockets.exceptions.ConnectionClosed:
-                    break
-                if isinstance(msg, (bytes, bytearray)):
-                    try:
-                        stdout.write(msg)
-                        stdout.flush()
-                    except Exception:
-                        break
-                else:
-                    # Control frames in JSON (e.g., exit)
+            async def pump_stdin() -> None:
+                # read() hands back everything buffered so far, so bursts coalesce
+                while data := await stdin_reader.read(_MAX_SEND):
                     try:
-                        payload = json.loads(msg)
+                        await ws.send(data)
                     except Exception:
-                        continue
-                    if isinstance(payload, dict) and payload.get("type") == "exit":
                         break
 
-        stdin_task = asyncio.create_task(pump_stdin())
-        ws_task = asyncio.create_task(pump_ws())
+            # PTY output is batched and written once the socket has nothing more
+            # ready (or the batch is large), instead of a write+flush per frame
+            out_pos = 0
+            flush_handle: asyncio.Handle | None = None
 
-        done, pending = await asyncio.wait({stdin_task, ws_task}, return_when=asyncio.FIRST_COMPLETED)
-        for t in pending:
-            t.cancel()
+            def flush_out() -> None:
+                nonlocal flush_handle, out_pos
+                if flush_handle is not None:
+                    flush_handle.cancel()
+                    flush_handle = None
+                if out_pos:
+                    end, out_pos = out_pos, 0
+                    _write_all(stdout_fd, _OUT_MV[:end])
 
-    # Restore terminal mode
-    termios.tcsetattr(stdin_fd, termios.TCSADRAIN, orig_attrs)
+            def flush_soon() -> None:
+                try:
+                    flush_out()
+                except Exception:
+                    pass
+
+            async def pump_ws() -> None:
+                nonlocal flush_handle, out_pos
+                try:
+                    async for msg in ws:
+                        # Nearly every frame is PTY output; test that case first
+                        if type(msg) is bytes:
+                            n = len(msg)
+                            try:
+                                if n >= _MAX_WRITE:
+                                    # Copying a big frame into the batch buys
+                                    # nothing: flush what's queued, then hand the
+                                    # frame to os.write as is
+                                    flush_out()
+                                    _write_all(stdout_fd, msg)
+                                    continue
+                                _OUT_MV[out_pos:out_pos + n] = msg
+                                out_pos += n
+                                if out_pos >= _MAX_WRITE:
+                                    flush_out()
+                                    continue
+                            except Exception:
+                                break
+                            if flush_handle is None:
+                                # Runs as soon as recv() has to wait for the network
+                                flush_handle = loop.call_soon(flush_soon)
+                        elif '"exit"' in msg:
+                            # Control frames in JSON; exit is the only one handled
+                            try:
+                                payload = json.loads(msg)
+                            except Exception:
+                                continue
+                            if isinstance(payload, dict) and payload.get("type") == "exit":
+                                break
+                except _ConnectionClosed:
+                    pass
+                finally:
+                    flush_soon()
+
+            async def until_done(pump: Awaitable[None]) -> None:
+                await pump
+                # Whichever side finishes first ends the session; raising makes
+                # the TaskGroup cancel the other pump
+                raise _SessionEnded
+
+            try:
+                async with asyncio.TaskGroup() as tg:
+                    tg.create_task(until_done(pump_stdin()))
+                    tg.create_task(until_done(pump_ws()))
+            except* _SessionEnded:
+                pass
+            stdin_transport.close()
+    finally:
+        # Restore terminal mode even if the session errors out; TCSANOW skips
+        # waiting for pending output to drain
+        termios.tcsetattr(stdin_fd, termios.TCSANOW, orig_attrs)
     return 0
 
 
@@ -148,9 +498,18 @@ def parse_args(argv: List[str]) -> argparse.Namespace:
 def main() -> None:
     args = parse_args(sys.argv[1:])
     try:
-        asyncio.run(run_client(args.url, args.token, args.cmd if args.cmd else None))
+        import uvloop
+        loop_factory = uvloop.new_event_loop
+    except ImportError:
+        loop_factory = None
+    try:
+        with asyncio.Runner(loop_factory=loop_factory) as runner:
+            runner.run(run_client(args.url, args.token, args.cmd if args.cmd else None))
     except KeyboardInterrupt:
         pass
+    except _ConnectionClosed as e:
+        sys.stderr.write(f"{e}\n")
+        sys.exit(1)
 
 
 if __name__ == "__main__":